@@ -1,35 +1,466 @@
 #!/usr/bin/env python3
 import argparse
+import atexit
 import json
 import requests
 import re
 import sys
+import tempfile
 import time
 import threading
 import os
-from collections import defaultdict, deque, Counter
+from collections import defaultdict, namedtuple, Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# httpx (with the h2 extra) is optional; when present it lets all parallel
+# fetches multiplex over a single HTTP/2 connection to pypi.org
+try:
+    import httpx
+    import h2  # noqa: F401 -- required for httpx's http2=True
+except ImportError:
+    httpx = None
+
+# orjson is optional; it parses PyPI's large JSON documents several times
+# faster than the stdlib json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 PYPI_URL = "https://pypi.org/pypi/{package}/json"
 
-# Flag to control the spinner thread
-spinner_active = False
+# Metadata for a single release; much smaller since it omits the file
+# listings of every other release
+PYPI_VERSION_URL = "https://pypi.org/pypi/{package}/{version}/json"
+
+# (connect, read) timeouts for PyPI requests, in seconds
+REQUEST_TIMEOUT = (3.05, 10)
+
+# Sent with every PyPI request; a fixed Accept-Encoding keeps all of our
+# requests on the same Fastly cache variant
+HTTP_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip",
+    "User-Agent": "pyreqs (https://github.com/stevenbecht/pyreqs)",
+}
+
+# Keep-alive connections held open per host; must be at least the number of
+# parallel workers, or urllib3 discards the surplus connections after each use
+HTTP_POOL_SIZE = 32
+
+# Transient failures are retried this many times, with exponential backoff
+# starting at RETRY_BACKOFF seconds
+HTTP_RETRIES = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Longest Retry-After (in seconds) that is waited out; a server asking for
+# more gets its response treated as a failure instead
+MAX_RETRY_WAIT = 60
+
+def _make_http_adapter(pool_size):
+    """Build the retrying connection-pool adapter for the shared session."""
+    return HTTPAdapter(
+        pool_maxsize=pool_size,
+        # Only failed connections are retried here; error statuses are
+        # retried by http_get, so that every attempt goes through rate_limiter
+        max_retries=Retry(total=HTTP_RETRIES, backoff_factor=RETRY_BACKOFF),
+    )
+
+# Shared HTTP session so every metadata fetch reuses the same keep-alive
+# connection pool instead of doing a fresh TCP+TLS handshake per package
+_session = requests.Session()
+_session.headers.update(HTTP_HEADERS)
+_session.mount("https://", _make_http_adapter(HTTP_POOL_SIZE))
+
+def _make_http_client(pool_size):
+    """Build the HTTP/2 client, holding up to pool_size connections."""
+    return httpx.Client(
+        # The transport retries failed connection attempts; status retries
+        # are done in http_get
+        transport=httpx.HTTPTransport(
+            http2=True,
+            retries=HTTP_RETRIES,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        ),
+        follow_redirects=True,  # PyPI redirects non-normalized project names
+        headers=HTTP_HEADERS,
+        timeout=httpx.Timeout(REQUEST_TIMEOUT[1], connect=REQUEST_TIMEOUT[0]),
+    )
+
+_client = _make_http_client(HTTP_POOL_SIZE) if httpx is not None else None
+
+def resize_http_pools(pool_size):
+    """Let the shared session and HTTP/2 client hold pool_size connections each."""
+    global _client
+    _session.mount("https://", _make_http_adapter(pool_size))
+    if _client is not None:
+        _client.close()
+        _client = _make_http_client(pool_size)
+
+def _close_http_clients():
+    """Close the pooled connections of the shared session and HTTP/2 client."""
+    _session.close()
+    if _client is not None:
+        _client.close()
+
+atexit.register(_close_http_clients)
+
+# Errors that make a package's metadata unavailable: error statuses from
+# raise_for_status(), plus timeouts, refused connections and other network failures
+if httpx is not None:
+    HTTP_ERRORS = (requests.RequestException, httpx.HTTPError)
+else:
+    HTTP_ERRORS = (requests.RequestException,)
+
+# Statuses saying the package (or release) no longer exists on PyPI
+GONE_STATUSES = (404, 410)
+
+class TokenBucket:
+    """Thread-safe token bucket capping how many requests start per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = max(1, capacity or rate)  # a burst of at least one request
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self.lock:
+                # Refill lazily from the elapsed time instead of a timer thread
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Keeps the parallel fetchers polite towards pypi.org; None means unlimited.
+# 429 responses are additionally retried honoring Retry-After (see http_get)
+rate_limiter = TokenBucket(20)
+
+def json_loads(raw):
+    """Parse a JSON document from bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def json_dumps(obj):
+    """Serialize obj to compact JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def write_json(obj, stream, compact=False):
+    """Write obj to a text stream as indented (or compact) JSON, using orjson when it is installed."""
+    if orjson is not None:
+        # Serialized in one C call; unlike json it writes non-ASCII text
+        # as UTF-8 instead of \u escapes
+        raw = orjson.dumps(obj, option=0 if compact else orjson.OPT_INDENT_2)
+        buffer = getattr(stream, "buffer", None)
+        if buffer is not None:
+            # Hand the bytes to the binary layer as they are, rather than
+            # decoding a second copy of the document into a str first
+            stream.flush()
+            buffer.write(raw)
+        else:
+            stream.write(raw.decode())
+    elif compact:
+        json.dump(obj, stream, separators=(",", ":"))
+    else:
+        # json.dump streams the encoded chunks instead of building the
+        # whole document as one string
+        json.dump(obj, stream, indent=2)
+
+def _retry_delay(resp, attempt):
+    """Return how long to wait before retrying resp: its Retry-After, else exponential backoff."""
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after:
+        # Either a number of seconds or an HTTP date
+        if retry_after.isdigit():
+            return int(retry_after)
+        try:
+            return max(0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return RETRY_BACKOFF * 2 ** attempt
+
+def http_get(url, headers=None):
+    """
+    GET a URL using the HTTP/2 client when available, else the shared session.
+    Responses with a RETRY_STATUSES status are retried up to HTTP_RETRIES
+    times, unless they ask for a wait longer than MAX_RETRY_WAIT; the last
+    response is returned either way, for raise_for_status().
+    """
+    for attempt in range(HTTP_RETRIES + 1):
+        # Retries count against the rate limit like any other request
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        if _client is not None:
+            resp = _client.get(url, headers=headers)
+        else:
+            resp = _session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if resp.status_code not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+            return resp
+        delay = _retry_delay(resp, attempt)
+        if delay > MAX_RETRY_WAIT:
+            return resp
+        time.sleep(delay)
+
+# Set to stop the spinner thread; waiting on it instead of sleeping lets
+# the spinner exit as soon as the build finishes
+spinner_stop = threading.Event()
 processed_count = 0
 
-# Cache for API responses to avoid redundant requests
-metadata_cache = {}
+class LRUCache:
+    """Thread-safe mapping holding at most maxsize entries, evicting the least recently used."""
 
-# Track errors and missing packages
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+# Cache for API responses to avoid redundant requests. Documents are trimmed
+# to a few KB each (see trim_metadata), so the bound sits well above the size
+# of realistic trees and only keeps long-lived processes from growing without
+# limit. An evicted package is read from the disk cache again if it is
+# requested later, or fetched from PyPI when the disk cache is disabled
+METADATA_CACHE_SIZE = 8192
+metadata_cache = LRUCache(METADATA_CACHE_SIZE)
+
+# A metadata_cache entry: the trimmed document and its analyze_wheels()
+# result, published together so no reader ever sees one without the other
+CachedMetadata = namedtuple("CachedMetadata", ["data", "wheel_analysis"])
+
+# Per-package records are namedtuples rather than dicts, which keeps the
+# result dicts of large trees small
+LicenseInfo = namedtuple(
+    "LicenseInfo", ["license", "license_url", "project_url", "author", "author_email"])
+# parents is a set that grows as more dependents of the package are seen
+MissingPackageInfo = namedtuple("MissingPackageInfo", ["error", "parents"])
+
+# Track errors and missing packages (package -> MissingPackageInfo)
 missing_packages = {}
 
-# Store license information for packages
+# Store license information for packages (package -> LicenseInfo)
 license_info = {}
 
 # Store flags for packages that need further investigation
 investigation_flags = {}
 
-def needs_investigation(package_data):
+# Wheel analysis of the packages seen in this run, read by the reports
+package_wheels = {}
+
+# Futures for metadata fetches currently in progress
+_inflight = {}
+
+# Errors of the fetches that failed during this run; such packages aren't retried
+_fetch_errors = {}
+
+# metadata_cache, _inflight and _fetch_errors are keyed by metadata_key(), as
+# a pinned release has a document of its own
+
+def default_cache_dir():
+    """
+    Return the disk cache directory used unless --cache-dir is given.
+    PYREQS_CACHE_DIR points it elsewhere, e.g. at a directory CI jobs restore
+    between runs; otherwise it is $XDG_CACHE_HOME/pyreqs (~/.cache/pyreqs).
+    """
+    return os.environ.get("PYREQS_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "pyreqs")
+
+# On-disk cache of PyPI responses shared between runs; set to None to disable.
+# main() sets it from the options and environment of each run
+disk_cache_dir = default_cache_dir()
+
+# How long (in seconds) a disk-cached response is used without asking PyPI;
+# older entries are revalidated with a conditional request
+DISK_CACHE_TTL = 24 * 3600
+
+# Guards shared state that worker threads update with read-modify-write
+# operations (missing package parents and in-flight fetches)
+_state_lock = threading.Lock()
+
+def reset_run_state():
+    """Clear the results recorded by a previous build_dependency_tree call.
+    The metadata cache is kept, since it doesn't depend
+    on the options of a run; the result dicts are cleared in place so that
+    references held elsewhere stay valid.
+    """
+    global processed_count
+    with _state_lock:
+        processed_count = 0
+        missing_packages.clear()
+        license_info.clear()
+        investigation_flags.clear()
+        package_wheels.clear()
+        _fetch_errors.clear()
+
+# Signals used by needs_investigation to detect native code
+KEYWORD_INDICATORS = ["c-extension", "rust", "cython", "ffi", "native"]
+
+# These classifiers definitively indicate native code
+STRONG_CLASSIFIERS = [
+    "Programming Language :: C",
+    "Programming Language :: C++",
+    "Programming Language :: Rust",
+    "Programming Language :: Cython",
+    "Topic :: Software Development :: Libraries :: Python Modules :: Foreign Function Interface"
+]
+
+FFI_PACKAGES = ["cython", "cffi", "pybind11", "rust", "maturin", "setuptools-rust", "cmake"]
+CRITICAL_FFI = ["cffi", "rust", "cython", "pybind11"]
+
+# Strong indicators in text that definitely suggest native deps
+STRONG_INDICATORS = [
+    "c extension", "native extension", "rust extension", 
+    "compiled extension", "wrapper around the c library", 
+    "bindings for the c library", "rust implementation",
+    "cython implementation", "binary module"
+]
+
+def _substring_re(terms):
+    """Compile a regex matching any of the given literal substrings."""
+    return re.compile("|".join(re.escape(term) for term in terms))
+
+# Precompiled so each string is scanned once in C instead of once per term
+_KEYWORD_RE = _substring_re(KEYWORD_INDICATORS)
+_STRONG_CLASSIFIER_RE = _substring_re(STRONG_CLASSIFIERS)
+_FFI_RE = _substring_re(FFI_PACKAGES)
+_CRITICAL_FFI_RE = _substring_re(CRITICAL_FFI)
+_STRONG_INDICATOR_RE = _substring_re(STRONG_INDICATORS)
+
+# Every classification analyze_wheels can assign to a package's files
+WHEEL_TYPES = ("pure-python", "abi3", "cpython-abi", "platform-specific", "contains-extension-modules")
+
+# File extensions of compiled extension modules
+NATIVE_EXT_SUFFIXES = (".so", ".pyd", ".dll")
+
+# Wheel filenames largely repeat across the packages of one tree (and across
+# the metadata of each version), so their classification is memoized
+@lru_cache(maxsize=2048)
+def _classify_wheel(filename):
+    """
+    Return the WHEEL_TYPES entry for a lowercased wheel filename, or None.
+    E.g. "six-1.16.0-py2.py3-none-any.whl" -> "pure-python"
+    """
+    # Remove .whl extension and split by '-'; names with fewer than
+    # three components aren't valid wheels and are skipped
+    wheel_parts = filename[:-4].split('-')
+    if len(wheel_parts) < 3:
+        return None
+    
+    # Last three components are python tag, abi tag, platform tag
+    python_tag, abi_tag, platform_tag = wheel_parts[-3:]
+    
+    # Pure Python wheels have 'none' abi and 'any' platform
+    if abi_tag == 'none' and platform_tag == 'any':
+        return "pure-python"
+    # ABI3 wheels are compatible with multiple Python versions
+    if 'abi3' in abi_tag:
+        return "abi3"
+    # CPython specific ABI wheels
+    if python_tag.startswith('cp') and abi_tag.startswith('cp'):
+        return "cpython-abi"
+    # Other platform-specific wheels
+    if platform_tag != 'any':
+        return "platform-specific"
+    return None
+
+def analyze_wheels(package_data):
+    """Classify the release files of a package's latest version by wheel type.
+    Done once per package at fetch time; both the investigation heuristics and
+    the reports read the result from package_wheels.
+    """
+    wheel_types = set()
+    has_wheels = False
+    has_extension_modules = False
+    has_platform_specific = False
+    
+    release_info = package_data.get("urls", []) or []
+    
+    for release in release_info:
+        # Validate up front rather than relying on exceptions: a null filename
+        # is treated like a missing one
+        filename = (release.get("filename") or "").lower()
+        
+        if filename.endswith(".whl"):
+            has_wheels = True
+            
+            wheel_type = _classify_wheel(filename)
+            if wheel_type and wheel_type != "pure-python":
+                has_platform_specific = True
+            if wheel_type:
+                wheel_types.add(wheel_type)
+        
+        # Check for C extension module markers in filenames; endswith with a
+        # tuple tests all suffixes in C without building any substrings
+        if filename.endswith(NATIVE_EXT_SUFFIXES):
+            has_extension_modules = True
+            wheel_types.add("contains-extension-modules")
+        
+        # Once every kind of file has been seen the remaining files (often
+        # hundreds for popular packages) can't change the result
+        if len(wheel_types) == len(WHEEL_TYPES):
+            break
+    
+    return {
+        "has_wheels": has_wheels,
+        # Listed in WHEEL_TYPES order, so the reports don't depend on the
+        # order PyPI happens to list a release's files in
+        "wheel_types": [wheel_type for wheel_type in WHEEL_TYPES if wheel_type in wheel_types],
+        "is_pure_python": not (has_extension_modules or has_platform_specific),
+        "has_extension_modules": has_extension_modules,
+        "has_platform_specific": has_platform_specific,
+    }
+
+def get_wheel_info(package):
+    """Return the wheel summary shown in reports for a fetched package, or None."""
+    analysis = package_wheels.get(package)
+    if not analysis:
+        return None
+        
+    return {
+        "has_wheels": analysis["has_wheels"],
+        "wheel_types": list(analysis["wheel_types"]),
+        "is_pure_python": analysis["is_pure_python"]
+    }
+
+def needs_investigation(package_data, wheel_analysis=None, fast_mode=True):
     """Determine if a package needs further investigation for non-Python deps.
     Only flags packages that definitively require native dependencies in a standard CPython environment.
+    In fast_mode, returns as soon as the package is certain to be flagged, so the
+    flags list may not give every reason; pass fast_mode=False for all of them.
     """
     info = package_data.get("info", {})
     flags = []
@@ -42,99 +473,59 @@ def needs_investigation(package_data):
     elif keywords is None:
         keywords = ""
         
-    keyword_indicators = ["c-extension", "rust", "cython", "ffi", "native"]
-    if any(ext in keywords.lower() for ext in keyword_indicators):
+    if _KEYWORD_RE.search(keywords.lower()):
         flags.append("Contains extension module keywords")
         confidence += 2
     
     # Check package classifiers - strong indicators
     classifiers = info.get("classifiers", []) or []
     
-    # These classifiers definitively indicate native code
-    strong_classifiers = [
-        "Programming Language :: C",
-        "Programming Language :: C++",
-        "Programming Language :: Rust",
-        "Programming Language :: Cython",
-        "Topic :: Software Development :: Libraries :: Python Modules :: Foreign Function Interface"
-    ]
+    # A "Pure Python" classifier lowers the final confidence by 3, so an
+    # early return has to clear the threshold by that much
+    mentions_pure_python = any("Pure Python" in c for c in classifiers)
+    early_threshold = 6 if mentions_pure_python else 3
+    
     for classifier in classifiers:
-        if any(term in classifier for term in strong_classifiers):
+        if _STRONG_CLASSIFIER_RE.search(classifier):
             flags.append(f"Uses native code: {classifier}")
             confidence += 3
     
+    if fast_mode and confidence >= early_threshold:
+        return flags
+    
     # Check for common FFI build dependencies that are DIRECT (not conditional)
     requires_dist = info.get("requires_dist", []) or []
     
-    ffi_packages = ["cython", "cffi", "pybind11", "rust", "maturin", "setuptools-rust", "cmake"]
-    critical_ffi = ["cffi", "rust", "cython", "pybind11"]
-    
     for req in requires_dist:
         req_lower = req.lower()
         
-        # Only count dependencies if they're DIRECT and unconditional
-        if ";" not in req_lower and "extra ==" not in req_lower:
-            for pkg in ffi_packages:
+        # Only count dependencies if they're DIRECT and unconditional;
+        # one regex scan rules out the common case of no FFI package at all
+        if ";" not in req_lower and "extra ==" not in req_lower and _FFI_RE.search(req_lower):
+            # Critical FFIs get even more confidence
+            is_critical = _CRITICAL_FFI_RE.search(req_lower) is not None
+            for pkg in FFI_PACKAGES:
                 if pkg in req_lower:
                     flags.append(f"Direct FFI dependency: {req}")
                     confidence += 3
-                    # Critical FFIs get even more confidence
-                    if any(crit in req_lower for crit in critical_ffi):
+                    if is_critical:
                         confidence += 1
     
+    if fast_mode and confidence >= early_threshold:
+        return flags
+    
     # Check if package has binaries/wheels with compiled code
     # Look at the available files for .so, .pyd, or non-pure Python wheels
-    is_pure_python = True
-    release_info = package_data.get("urls", []) or []
-    wheel_types = set()
-    has_platform_specific_wheels = False
+    if wheel_analysis is None:
+        wheel_analysis = analyze_wheels(package_data)
+    wheel_types = wheel_analysis["wheel_types"]
     
-    for release in release_info:
-        filename = release.get("filename", "").lower()
-        
-        # Check for C extension module markers in filenames
-        if any(ext in filename for ext in [".so", ".pyd", ".dll"]):
-            is_pure_python = False
-            flags.append("Contains compiled extension modules")
-            confidence += 5
-            break
-            
-        # Analyze wheel types in detail
-        if filename.endswith(".whl"):
-            # Parse wheel filename components
-            try:
-                # Remove .whl extension and split by '-'
-                wheel_parts = filename[:-4].split('-')
-                if len(wheel_parts) >= 3:
-                    # Last three components are python tag, abi tag, platform tag
-                    python_tag = wheel_parts[-3]
-                    abi_tag = wheel_parts[-2]
-                    platform_tag = wheel_parts[-1]
-                    
-                    # Pure Python wheels have 'none' abi and 'any' platform
-                    if abi_tag == 'none' and platform_tag == 'any':
-                        wheel_types.add("pure-python")
-                    # ABI3 wheels are compatible with multiple Python versions
-                    elif 'abi3' in abi_tag:
-                        wheel_types.add("abi3")
-                        has_platform_specific_wheels = True
-                    # CPython specific ABI wheels
-                    elif python_tag.startswith('cp') and abi_tag.startswith('cp'):
-                        wheel_types.add("cpython-abi")
-                        has_platform_specific_wheels = True
-                    # Other platform-specific wheels
-                    elif platform_tag != 'any':
-                        wheel_types.add("platform-specific")
-                        has_platform_specific_wheels = True
-            except:
-                # If parsing fails, fall back to simple check
-                if "py3-none-any" not in filename:
-                    has_platform_specific_wheels = True
+    if wheel_analysis["has_extension_modules"]:
+        flags.append("Contains compiled extension modules")
+        confidence += 5
     
     # Add appropriate flags based on wheel analysis
-    if has_platform_specific_wheels:
-        is_pure_python = False
-        
+    if wheel_analysis["has_platform_specific"]:
         if "abi3" in wheel_types:
             flags.append("Contains ABI3 wheels (stabilized C-API, compiled code)")
             confidence += 4
@@ -148,10 +539,13 @@ def needs_investigation(package_data):
             flags.append("Non-pure Python wheel (likely contains compiled code)")
             confidence += 3
     
+    # The documentation text scan below is the most expensive check
+    if fast_mode and confidence >= early_threshold:
+        return flags
+    
     # If pure Python is explicitly mentioned in classifiers, decrease confidence
-    if any("Pure Python" in c for c in classifiers):
+    if mentions_pure_python:
         confidence -= 3
-        is_pure_python = True
     
     # Check description and summary but require strong evidence
     # Fix: Make sure description and summary are not None before using lower()
@@ -167,19 +561,15 @@ def needs_investigation(package_data):
     else:
         summary = summary.lower()
     
-    # Strong indicators in text that definitely suggest native deps
-    strong_indicators = [
-        "c extension", "native extension", "rust extension", 
-        "compiled extension", "wrapper around the c library", 
-        "bindings for the c library", "rust implementation",
-        "cython implementation", "binary module"
-    ]
-    
-    # Check for the strongest indicators
-    for indicator in strong_indicators:
-        if indicator in description or indicator in summary:
-            flags.append(f"Documentation explicitly mentions native code: '{indicator}'")
-            confidence += 2
+    # Check for the strongest indicators. Description and summary are joined
+    # into one lowercased string (the NUL keeps a phrase from spanning both)
+    # so a single regex scan rules out the common no-match case
+    doc_text = description + "\x00" + summary
+    if _STRONG_INDICATOR_RE.search(doc_text):
+        for indicator in STRONG_INDICATORS:
+            if indicator in doc_text:
+                flags.append(f"Documentation explicitly mentions native code: '{indicator}'")
+                confidence += 2
     
     # Only return flags if our confidence is high enough
     # This filters out packages that only have weak signals
@@ -190,132 +580,391 @@ def needs_investigation(package_data):
 
 def show_spinner():
     """Display a spinner with package count to indicate progress."""
-    global spinner_active, processed_count
     spinner_chars = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
+    # Prebuild the encoded frames; only the package count changes per redraw
+    frames = [f"\r{c} Processing dependencies... (".encode() for c in spinner_chars]
+    out = getattr(sys.stderr, "buffer", None)
     i = 0
-    
-    while spinner_active:
-        # Display spinner and package count, then return to start of line
-        sys.stderr.write(f"\r{spinner_chars[i]} Processing dependencies... ({processed_count} packages)")
-        sys.stderr.flush()
-        time.sleep(0.1)
-        i = (i + 1) % len(spinner_chars)
+    last_count = None
+    
+    while not spinner_stop.is_set():
+        count = processed_count
+        # Skip the write+flush syscalls while nothing has changed, but still
+        # advance the spinner about once a second so it visibly stays alive
+        if count != last_count or i % 4 == 0:
+            line = frames[i % len(frames)] + f"{count} packages)".encode()
+            if out is not None:
+                out.write(line)
+                out.flush()
+            else:
+                sys.stderr.write(line.decode())
+                sys.stderr.flush()
+            last_count = count
+        spinner_stop.wait(0.25)
+        i += 1
     
     # Clear the line when done
     sys.stderr.write("\r" + " " * 60 + "\r")
     sys.stderr.flush()
 
+# License families in order of precedence when a license string mentions
+# several, each with a function giving the normalized name
+LICENSE_FAMILIES = [
+    ("mit", lambda s: "MIT"),
+    ("apache", lambda s: "Apache-2.0" if "2" in s else "Apache"),
+    ("bsd", lambda s: "BSD-3-Clause" if "3" in s else "BSD-2-Clause" if "2" in s else "BSD"),
+    ("gpl", lambda s: "GPL-3.0" if "3" in s else "GPL-2.0" if "2" in s else "GPL"),
+    ("lgpl", lambda s: "LGPL"),
+    ("mpl", lambda s: "MPL"),
+    ("public domain", lambda s: "Public Domain"),
+    ("isc", lambda s: "ISC"),
+]
+
+# Other spellings that identify a license family
+LICENSE_ALIASES = {"gnu general public": "gpl", "mozilla": "mpl"}
+
+# "lgpl" is listed before "gpl" so LGPL strings aren't reported as GPL
+_LICENSE_RE = re.compile(r"lgpl|gpl|gnu general public|mit|apache|bsd|mpl|mozilla|public domain|isc")
+
 def extract_license_info(package_data):
     """Extract license information from PyPI metadata."""
     info = package_data.get("info", {})
-    result = {
-        "license": info.get("license") or "Unknown",
-        "license_url": None,
-        "project_url": info.get("project_url") or info.get("home_page"),
-        "author": info.get("author"),
-        "author_email": info.get("author_email"),
-    }
     
     # Extract license URL from project URLs if available
+    license_url = None
     project_urls = info.get("project_urls", {})
     if project_urls:
         for key, url in project_urls.items():
             if "license" in key.lower():
-                result["license_url"] = url
+                license_url = url
                 break
     
-    # Try to normalize common license names
-    license_name = result["license"].lower()
-    if "mit" in license_name:
-        result["license"] = "MIT"
-    elif "apache" in license_name:
-        if "2.0" in license_name or "2" in license_name:
-            result["license"] = "Apache-2.0"
-        else:
-            result["license"] = "Apache"
-    elif "bsd" in license_name:
-        if "3" in license_name:
-            result["license"] = "BSD-3-Clause"
-        elif "2" in license_name:
-            result["license"] = "BSD-2-Clause"
-        else:
-            result["license"] = "BSD"
-    elif "gpl" in license_name or "gnu general public" in license_name:
-        if "v3" in license_name or "3" in license_name:
-            result["license"] = "GPL-3.0"
-        elif "v2" in license_name or "2" in license_name:
-            result["license"] = "GPL-2.0"
+    # Packages without a license field (setuptools used to fill in "UNKNOWN")
+    # skip normalization entirely
+    license_text = info.get("license")
+    if not license_text or license_text.strip().lower() in ("unknown", "none", ""):
+        license_text = "Unknown"
+    else:
+        license_text = normalize_license(license_text)
+    
+    return LicenseInfo(
+        license=license_text,
+        license_url=license_url,
+        project_url=info.get("project_url") or info.get("home_page"),
+        author=info.get("author"),
+        author_email=info.get("author_email"),
+    )
+
+# Most packages of a tree share a handful of license strings ("MIT",
+# "BSD License", ...), so each distinct one is only scanned once
+@lru_cache(maxsize=1024)
+def normalize_license(license_text):
+    """
+    Map a license string to a common short name, or return it unchanged.
+    E.g. "Apache Software License 2.0" -> "Apache-2.0"
+    """
+    # One regex scan finds every family mentioned, then the first one in
+    # precedence order wins
+    license_name = license_text.lower()
+    families = {LICENSE_ALIASES.get(m, m) for m in _LICENSE_RE.findall(license_name)}
+    for family, normalize in LICENSE_FAMILIES:
+        if family in families:
+            return normalize(license_name)
+    return license_text
+
+_CANONICAL_SEPARATORS_RE = re.compile(r"[-_.]+")
+
+@lru_cache(maxsize=4096)
+def canonical_name(package):
+    """
+    Return the PEP 503 normalized form of a project name.
+    E.g. "charset_normalizer" -> "charset-normalizer"
+         "Zope.Interface" -> "zope-interface"
+    """
+    return _CANONICAL_SEPARATORS_RE.sub("-", package).lower()
+
+def metadata_key(package, version=None):
+    """
+    Return the key the metadata of a package (or one release of it) is cached under.
+    E.g. "Flask" -> "flask", ("Flask", "3.0.0") -> "flask==3.0.0"
+    """
+    project = canonical_name(package)
+    return project if version is None else f"{project}=={version}"
+
+def _disk_cache_path(package):
+    """Return the cache file path for a package, or None if it can't be cached."""
+    if not disk_cache_dir or os.sep in package or package.startswith("."):
+        return None
+    return os.path.join(disk_cache_dir, f"{package}.json")
+
+def load_disk_cache(package, max_age=DISK_CACHE_TTL):
+    """Load PyPI metadata for a package from the disk cache if it is at most max_age seconds old (any age if None)."""
+    path = _disk_cache_path(package)
+    if path is None:
+        return None
+    try:
+        if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+            return None
+        with open(path, 'rb') as f:
+            # Entries written by older versions still hold the full document
+            return trim_metadata(json_loads(f.read()))
+    except (OSError, ValueError):
+        # Missing or unreadable cache entries just mean a network fetch
+        return None
+
+def load_cache_validators(package):
+    """Return conditional request headers for revalidating a package's disk cache entry."""
+    path = _disk_cache_path(package)
+    if path is None or not os.path.exists(path):
+        return {}
+    try:
+        with open(f"{path}.meta", 'rb') as f:
+            meta = json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+def touch_disk_cache(package):
+    """Mark a package's disk cache entry as fresh again after PyPI confirmed it is unchanged."""
+    path = _disk_cache_path(package)
+    if path is None:
+        return
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _atomic_write(path, data):
+    """Write data to path via a temporary file so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def save_disk_cache(package, raw, headers=None):
+    """Write the JSON body for a package, and its cache validators, to the disk cache."""
+    path = _disk_cache_path(package)
+    if path is None:
+        return
+    headers = headers or {}
+    meta = {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+    try:
+        os.makedirs(disk_cache_dir, exist_ok=True)
+        # Body first: a validator must never describe a body we don't have
+        _atomic_write(path, raw)
+        _atomic_write(f"{path}.meta", json.dumps(meta).encode())
+    except OSError as e:
+        print(f"Warning: Could not write cache for {package}: {e}", file=sys.stderr)
+
+# The parts of a PyPI JSON document pyreqs reads: these "info" fields (used by
+# get_dependencies, extract_license_info and needs_investigation) and the
+# filenames of the "urls" file entries. "releases", the file lists of every
+# version ever published, is usually well over 90% of the document and is dropped
+INFO_KEYS = (
+    "version", "requires_dist", "license", "project_url", "home_page", "author",
+    "author_email", "project_urls", "classifiers", "keywords", "summary", "description",
+)
+
+def trim_metadata(data):
+    """Return just the parts of a PyPI JSON document that pyreqs reads."""
+    trimmed = {}
+    if "info" in data:
+        info = data["info"] or {}
+        trimmed["info"] = {key: info[key] for key in INFO_KEYS if key in info}
+    if "urls" in data:
+        trimmed["urls"] = [{"filename": release.get("filename")} for release in data["urls"] or []]
+    return trimmed
+
+def _fetch_pypi_metadata(package, cache_key, verbose, version):
+    """
+    Load uncached metadata from the disk cache or PyPI into metadata_cache;
+    returns the new entry, or None after recording the error in _fetch_errors.
+    """
+    # PyPI redirects any other spelling of a name to its canonical URL, so
+    # asking for that directly saves a round trip; spellings such as
+    # charset_normalizer and charset-normalizer also share one disk cache entry
+    project = canonical_name(package)
+    
+    # Reuse metadata saved by a previous run before going to the network
+    data = load_disk_cache(cache_key)
+    if data is not None:
+        if verbose:
+            print(f"Using disk-cached metadata for {package}", file=sys.stderr)
+    else:
+        if verbose:
+            print(f"Fetching metadata for {package}...", file=sys.stderr)
+        
+        if version is None:
+            url = PYPI_URL.format(package=project)
         else:
-            result["license"] = "GPL"
-    elif "lgpl" in license_name:
-        result["license"] = "LGPL"
-    elif "mpl" in license_name or "mozilla" in license_name:
-        result["license"] = "MPL"
-    elif "public domain" in license_name:
-        result["license"] = "Public Domain"
-    elif "isc" in license_name:
-        result["license"] = "ISC"
-    
-    return result
-
-def get_pypi_metadata(package, verbose=False, parent=None, fetch_license=False):
-    """Fetch metadata for a package from PyPI with caching."""
-    global metadata_cache, missing_packages, license_info, investigation_flags
+            url = PYPI_VERSION_URL.format(package=project, version=version)
+        try:
+            # A stale disk cache entry is revalidated rather than downloaded again
+            resp = http_get(url, load_cache_validators(cache_key))
+            if resp.status_code == 304:
+                data = load_disk_cache(cache_key, max_age=None)
+                if data is not None:
+                    if verbose:
+                        print(f"Disk-cached metadata for {package} is still current", file=sys.stderr)
+                    touch_disk_cache(cache_key)
+                else:
+                    # The entry vanished since we read its validators
+                    resp = http_get(url)
+            if data is None:
+                resp.raise_for_status()
+                # Parse straight from the body bytes; .json()/.text would first
+                # decode the whole payload into a str. This already runs on a
+                # fetch worker, overlapping the other requests; a process pool
+                # wouldn't help, as sending the parsed document back to this
+                # process costs more than parsing it
+                data = trim_metadata(json_loads(resp.content))
+                # Only the trimmed document is written, so that later runs
+                # read and parse a fraction of the bytes
+                save_disk_cache(cache_key, json_dumps(data), resp.headers)
+        except HTTP_ERRORS as e:
+            # httpx appends a multi-line help URL; keep just the status line
+            error_msg = f"{e}".splitlines()[0]
+            
+            # When PyPI can't be reached or keeps failing, an expired disk
+            # cache entry is better than nothing; only a package that is gone
+            # from PyPI makes the entry stale
+            response = getattr(e, "response", None)
+            if response is None or response.status_code not in GONE_STATUSES:
+                data = load_disk_cache(cache_key, max_age=None)
+            if data is not None:
+                print(f"Warning: Using expired cached metadata for {package}: {error_msg}", file=sys.stderr)
+            else:
+                _fetch_errors[cache_key] = error_msg
+                return None
+    
+    # Cache the response along with its wheel analysis
+    entry = metadata_cache[cache_key] = CachedMetadata(data, analyze_wheels(data))
+    return entry
+
+def load_metadata(package, verbose=False, version=None):
+    """
+    Return the metadata_cache entry for a package (or one specific version of
+    it), fetching it if needed, or None if it couldn't be fetched. Unlike
+    get_pypi_metadata, nothing is recorded about the package in this run's
+    results, so fetching ahead of time on a guess is harmless.
+    """
+    cache_key = metadata_key(package, version)
     
     # Use cached response if available
-    if package in metadata_cache:
+    entry = metadata_cache.get(cache_key)
+    if entry is not None:
         if verbose:
             print(f"Using cached metadata for {package}", file=sys.stderr)
-        
-        # Extract license info if requested and not already cached
-        if fetch_license and package not in license_info:
-            license_info[package] = extract_license_info(metadata_cache[package])
-            
-        # Always check for investigation flags
-        if package not in investigation_flags:
-            flags = needs_investigation(metadata_cache[package])
-            if flags:
-                investigation_flags[package] = flags
-                
-        return metadata_cache[package]
+        return entry
     
-    if verbose:
-        print(f"Fetching metadata for {package}...", file=sys.stderr)
+    # Coalesce concurrent requests for the same package: the first caller
+    # fetches it, later callers wait on its result instead of issuing their own GET
+    with _state_lock:
+        # A package that already failed during this run isn't retried either
+        if cache_key in _fetch_errors:
+            return None
+        future = _inflight.get(cache_key)
+        is_owner = future is None
+        if is_owner:
+            future = _inflight[cache_key] = Future()
+    
+    if not is_owner:
+        if verbose:
+            print(f"Waiting for in-flight fetch of {package}", file=sys.stderr)
+        return future.result()
     
-    url = PYPI_URL.format(package=package)
     try:
-        resp = requests.get(url)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        # Cache the response
-        metadata_cache[package] = data
+        entry = _fetch_pypi_metadata(package, cache_key, verbose, version)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(entry)
+        return entry
+    finally:
+        with _state_lock:
+            del _inflight[cache_key]
+
+def record_metadata(package, entry, version=None, parent=None, fetch_license=False, thorough_investigation=False,
+                    investigate=True):
+    """
+    Record what a load_metadata() result tells us about a package in this
+    run's results: its wheels, license and investigation flags, or that it is
+    missing (required by parent, if given). fetch_license and investigate
+    select whether the license and investigation flags are worked out at all.
+    """
+    if entry is None:
+        error_msg = _fetch_errors.get(metadata_key(package, version), "Unknown error")
+        with _state_lock:
+            info = missing_packages.get(package)
+            if info is None:
+                print(f"Warning: Could not get metadata for {package}: {error_msg}", file=sys.stderr)
+                info = missing_packages[package] = MissingPackageInfo(error_msg, set())
+            if parent:
+                info.parents.add(parent)
+        return
+    
+    data = entry.data
+    package_wheels[package] = entry.wheel_analysis
+    
+    # Extract license info if requested and not already recorded
+    if fetch_license and package not in license_info:
+        license_info[package] = extract_license_info(data)
         
-        # Extract license information if requested
-        if fetch_license:
-            license_info[package] = extract_license_info(data)
-            
-        # Always check if package needs investigation
-        flags = needs_investigation(data)
+    # Check for investigation flags unless nothing will show them
+    if investigate and package not in investigation_flags:
+        flags = needs_investigation(data, entry.wheel_analysis, fast_mode=not thorough_investigation)
         if flags:
             investigation_flags[package] = flags
-            
-        return data
-    except requests.HTTPError as e:
-        error_msg = f"{e}"
-        print(f"Warning: Could not get metadata for {package}: {error_msg}", file=sys.stderr)
-        
-        # Track the missing package and its parent
-        if package not in missing_packages:
-            missing_packages[package] = {
-                'error': error_msg,
-                'parents': set()
-            }
-        if parent:
-            missing_packages[package]['parents'].add(parent)
-            
-        return None
 
+def get_pypi_metadata(package, verbose=False, parent=None, fetch_license=False, version=None, thorough_investigation=False):
+    """Fetch metadata for a package (or one specific version of it) from PyPI with caching."""
+    entry = load_metadata(package, verbose, version)
+    record_metadata(package, entry, version, parent, fetch_license, thorough_investigation)
+    return None if entry is None else entry.data
+
+# The requirement helpers below are pure functions of the requirement string
+# and get called on the same strings many times, so they are memoized. The
+# caches are bounded so a long-lived process resolving many trees (e.g. one
+# calling main() repeatedly) doesn't grow them without limit
+REQUIREMENT_CACHE_SIZE = 8192
+
+# Environment marker fragments that make a requirement conditional
+OPTIONAL_MARKERS = [
+    'extra ==', 'extra!=', 
+    'platform_', 'sys_platform', 
+    'implementation_name', 
+    'python_version', 'python_full_version',
+    'os_name', 'platform_machine'
+]
+
+# Common development-related package names
+DEV_PACKAGES = [
+    'pytest', 'nose', 'mock', 'coverage', 'flake8', 'pylint', 
+    'sphinx', 'doc', 'test', 'dev', 'lint', 'check', 'tox', 'black',
+    'isort', 'mypy', 'pep8', 'setuptools', 'wheel', 'build', 'twine',
+    'typecheck', 'typing'
+]
+
+# Extras that mark a requirement as a dev dependency
+DEV_EXTRA_MARKERS = ['extra == "dev"', 'extra == "test"', 'extra == "docs"']
+
+_OPTIONAL_MARKER_RE = _substring_re(OPTIONAL_MARKERS)
+_DEV_PACKAGE_RE = _substring_re(DEV_PACKAGES)
+_DEV_EXTRA_RE = _substring_re(DEV_EXTRA_MARKERS)
+
+_REQ_SPLIT_RE = re.compile(r"[\s<>=!~;\[]")
+
+@lru_cache(maxsize=REQUIREMENT_CACHE_SIZE)
 def parse_requirement(req_string):
     """
     Parse a requirement string to extract just the package name.
@@ -323,15 +972,13 @@ def parse_requirement(req_string):
          "urllib3 [socks]" -> "urllib3"
          "charset-normalizer<4,>=2" -> "charset-normalizer"
     """
-    # Remove extras (anything in square brackets)
-    req_string = req_string.split('[', 1)[0].strip()
+    # The name ends at the first extras bracket, whitespace, version operator
+    # or marker separator; strip first so leading whitespace can't end it
+    name = _REQ_SPLIT_RE.split(req_string.strip(), maxsplit=1)[0]
     
-    # Remove version specifiers (anything in parentheses or after comparison operators)
-    # Fix the deprecation warning by using named parameter
-    req_string = re.split(r'[\s<>=!~;]', req_string, maxsplit=1)[0].strip()
-    
-    return req_string.lower()  # Normalize to lowercase for better comparison
+    return name.lower()  # Normalize to lowercase for better comparison
 
+@lru_cache(maxsize=REQUIREMENT_CACHE_SIZE)
 def is_conditional_dependency(req_string):
     """
     Determine if a dependency is conditional or optional.
@@ -340,18 +987,8 @@ def is_conditional_dependency(req_string):
     # Check for environment markers and extras
     if ';' in req_string:
         # Look for common optional dependency patterns
-        lower_req = req_string.lower()
-        optional_markers = [
-            'extra ==', 'extra!=', 
-            'platform_', 'sys_platform', 
-            'implementation_name', 
-            'python_version', 'python_full_version',
-            'os_name', 'platform_machine'
-        ]
-        
-        for marker in optional_markers:
-            if marker in lower_req:
-                return True
+        if _OPTIONAL_MARKER_RE.search(req_string.lower()):
+            return True
     
     # Check for explicit extras notation [extra]
     if '[' in req_string and ']' in req_string:
@@ -359,72 +996,59 @@ def is_conditional_dependency(req_string):
     
     return False
 
+@lru_cache(maxsize=REQUIREMENT_CACHE_SIZE)
 def is_dev_dependency(req_string):
     """Identify development, test, or doc dependencies"""
-    lower_req = req_string.lower()
-    
-    # Common development-related package names
-    dev_packages = [
-        'pytest', 'nose', 'mock', 'coverage', 'flake8', 'pylint', 
-        'sphinx', 'doc', 'test', 'dev', 'lint', 'check', 'tox', 'black',
-        'isort', 'mypy', 'pep8', 'setuptools', 'wheel', 'build', 'twine',
-        'typecheck', 'typing'
-    ]
-    
     # Check if dependency name is a common dev package
-    pkg_name = parse_requirement(req_string)
-    if any(dev in pkg_name for dev in dev_packages):
+    if _DEV_PACKAGE_RE.search(parse_requirement(req_string)):
         return True
     
     # Check for dev-related extras or markers
-    if any(marker in lower_req for marker in ['extra == "dev"', 'extra == "test"', 'extra == "docs"']):
+    if _DEV_EXTRA_RE.search(req_string.lower()):
         return True
     
     return False
 
-def get_dependencies(package, version=None, verbose=False, include_conditional=False, include_dev=False, fetch_license=False):
+_PINNED_VERSION_RE = re.compile(r"^[^<>=!~;\s\[]+\s*(?:\[[^\]]*\])?\s*===?\s*([^\s,;*]+)\s*$")
+
+def pinned_version(req_string):
+    """
+    Return the exact version a requirement pins, or None.
+    E.g. "requests==2.31.0" -> "2.31.0"
+         "requests>=2.31.0" -> None
+    """
+    match = _PINNED_VERSION_RE.match(req_string.strip())
+    return match.group(1) if match else None
+
+def get_dependencies(package, version=None, verbose=False, include_conditional=False, include_dev=False, fetch_license=False, thorough_investigation=False):
     """
-    Return a list of direct dependencies for the given package and version.
+    Return the direct dependencies for the given package and version as a list
+    of (requirement, name) tuples, e.g. ("urllib3<3,>=1.21.1", "urllib3").
     We'll parse the 'requires_dist' field from PyPI JSON.
     """
     # Make sure to use just the package name for API call
     clean_package_name = parse_requirement(package)
     
-    data = get_pypi_metadata(clean_package_name, verbose, parent=package, fetch_license=fetch_license)
+    data = get_pypi_metadata(clean_package_name, verbose, parent=package, fetch_license=fetch_license, version=version,
+                             thorough_investigation=thorough_investigation)
     if data is None:
         return []
-        
-    if version is None:
-        # Use the latest release version
-        version = data["info"]["version"]
-        if verbose:
-            print(f"Using version {version} for {clean_package_name}", file=sys.stderr)
+    return _dependencies_from_metadata(data, clean_package_name, version, verbose, include_conditional, include_dev)
 
-    # Acquire the 'requires_dist' for the chosen version
-    release_info_list = data["releases"].get(version, [])
-    if not release_info_list:
-        requires_dist = data["info"].get("requires_dist", [])
-    else:
-        requires_dist = release_info_list[0].get("requires_dist", data["info"].get("requires_dist", []))
+def _dependencies_from_metadata(data, clean_package_name, version, verbose, include_conditional, include_dev):
+    """Return the (requirement, name) dependency tuples of an already fetched PyPI document."""
+    # Without a pin this is the latest release's document
+    if verbose and version is None:
+        print(f"Using version {data['info'].get('version')} for {clean_package_name}", file=sys.stderr)
+
+    # Acquire the 'requires_dist' from 'info'; the per-file entries under
+    # 'releases' don't carry it, so looking there only ever fell back to this.
+    # A pinned version was fetched from its own per-release document, whose
+    # 'info' describes that release
+    requires_dist = data["info"].get("requires_dist") or []
 
-    deps = []
-    filtered_conditional = 0
-    filtered_dev = 0
-    
     if requires_dist:
-        for req in requires_dist:
-            # Skip conditional dependencies unless explicitly requested
-            if not include_conditional and is_conditional_dependency(req):
-                filtered_conditional += 1
-                continue
-                
-            # Skip dev dependencies unless explicitly requested
-            if not include_dev and is_dev_dependency(req):
-                filtered_dev += 1
-                continue
-            
-            # Keep the original requirement text for display
-            deps.append(req)
+        deps, filtered_conditional, filtered_dev = filter_requirements(requires_dist, include_conditional, include_dev)
             
         if verbose:
             total_filtered = filtered_conditional + filtered_dev
@@ -433,80 +1057,184 @@ def get_dependencies(package, version=None, verbose=False, include_conditional=F
             else:
                 print(f"Found {len(deps)} dependencies for {clean_package_name}", file=sys.stderr)
     else:
+        deps = []
         if verbose:
             print(f"No dependencies found for {clean_package_name}", file=sys.stderr)
             
     return deps
 
-def build_dependency_tree(root_package, max_depth=float('inf'), verbose=False, include_conditional=False, include_dev=False, fetch_license=False):
+def filter_requirements(requires_dist, include_conditional=False, include_dev=False):
+    """
+    Return the requirements to follow from a requires_dist list as
+    (requirement, name) tuples, along with how many conditional and dev
+    requirements were dropped.
+    """
+    deps = []
+    filtered_conditional = 0
+    filtered_dev = 0
+    
+    for req in requires_dist:
+        # Skip conditional dependencies unless explicitly requested
+        if not include_conditional and is_conditional_dependency(req):
+            filtered_conditional += 1
+            continue
+            
+        # Skip dev dependencies unless explicitly requested
+        if not include_dev and is_dev_dependency(req):
+            filtered_dev += 1
+            continue
+        
+        # Keep the original requirement text for display
+        deps.append((req, parse_requirement(req)))
+    
+    return deps, filtered_conditional, filtered_dev
+
+def _fetch_metadata_batch(executor, fetch, packages, started):
+    """
+    Fetch the metadata for a batch of packages in parallel by running
+    fetch(*entry) on executor for each entry, and return the results in
+    order. An entry starts with the requirement and its clean name; a package
+    whose name is in started, a dict of futures for fetches submitted ahead
+    of time, is waited on instead of being fetched again.
+    """
+    futures = [started.pop(entry[1], None) or executor.submit(fetch, *entry) for entry in packages]
+    # Surface unexpected errors from the workers here
+    return [future.result() for future in futures]
+
+def build_dependency_tree(root_package, max_depth=float('inf'), verbose=False, include_conditional=False, include_dev=False, fetch_license=False, max_workers=16, thorough_investigation=False, investigate=True):
     """
     Build a dependency tree (dict) for the root_package up to max_depth.
-    We'll do a BFS to store direct dependencies at each level.
+    We'll do a level-by-level BFS, fetching the metadata for every package
+    at a level in parallel and then expanding the level from those documents.
+    The tree maps each package name to a list of (requirement, name) tuples
+    for its dependencies, so consumers don't have to parse them again.
+    fetch_license and investigate=False skip the license and investigation
+    results when nothing will display them.
     """
-    global spinner_active, processed_count, missing_packages, license_info
-    processed_count = 0
-    missing_packages = {}  # Reset missing packages
-    license_info = {}      # Reset license info
+    global processed_count
+    # Results of an earlier call (e.g. a repeated main()) would otherwise
+    # leak into this one; investigation flags from a fast run would also
+    # hide the full reasons from a thorough one
+    reset_run_state()
     
     if verbose:
         print(f"Building dependency tree for {root_package}...", file=sys.stderr)
         print(f"Options: {'include conditional deps' if include_conditional else 'core deps only'}, {'include dev deps' if include_dev else 'exclude dev deps'}, {'fetch license info' if fetch_license else 'no license info'}", file=sys.stderr)
-    else:
-        # Start spinner in a separate thread if not in verbose mode
-        spinner_active = True
+    # Start spinner in a separate thread if not in verbose mode; when stderr
+    # isn't a terminal nobody sees it, so don't wake up to draw it
+    spinner_thread = None
+    if not verbose and sys.stderr.isatty():
+        spinner_stop.clear()
         spinner_thread = threading.Thread(target=show_spinner)
         spinner_thread.daemon = True
         spinner_thread.start()
     
-    visited = set()
+    # Every package that has been put on a frontier; checking it before
+    # enqueueing means a shared dependency (A->B->D, A->C->D) is queued once
+    enqueued = set()
     tree = defaultdict(list)
     # Track the depth at which each package was first encountered
     package_depths = {}
     
-    queue = deque([(root_package, 0)])
+    # Packages whose metadata fetch has been started ahead of their level,
+    # and the futures of those fetches that no level has collected yet. The
+    # futures keep the documents referenced until their level is expanded,
+    # whether or not metadata_cache still holds them by then
+    speculated = set()
+    speculative = {}
+    
+    # Fetches only load documents; a package's results are recorded when its
+    # level collects the document, so a guess that never makes it into the
+    # tree leaves no trace in the reports
+    def prefetch(package, clean_package, version, depth):
+        entry = load_metadata(clean_package, verbose, version)
+        if entry is None or depth + 1 >= max_depth:
+            return entry
+        
+        # Start on this package's own dependencies right away, so the next
+        # level doesn't have to wait for the slowest fetch of this one. They
+        # are exactly the ones the level expansion will ask for, since the
+        # same filters apply
+        requires_dist = entry.data["info"].get("requires_dist") or []
+        deps, _, _ = filter_requirements(requires_dist, include_conditional, include_dev)
+        for dep, clean_dep in deps:
+            with _state_lock:
+                if clean_dep in speculated:
+                    continue
+                speculated.add(clean_dep)
+                try:
+                    speculative[clean_dep] = executor.submit(prefetch, dep, clean_dep, None, depth + 1)
+                except RuntimeError:
+                    # The build finished and the pool is shutting down
+                    break
+        return entry
     
+    frontier = [(root_package, parse_requirement(root_package))]
+    enqueued.add(frontier[0][1])
+    # The root is never fetched by speculation: a dependency cycling back to
+    # it would fetch its latest release rather than the pinned one
+    speculated.add(frontier[0][1])
+    depth = 0
+    
+    executor = ThreadPoolExecutor(max_workers=max_workers)
     try:
-        while queue:
-            package, depth = queue.popleft()
-            clean_package = parse_requirement(package)
-            
-            if clean_package in visited or depth >= max_depth:
-                continue
-                
-            # Store the first depth this package was encountered
-            if clean_package not in package_depths:
+        while frontier and depth < max_depth:
+            level = []
+            for package, clean_package in frontier:
+                # Store the first depth this package was encountered
                 package_depths[clean_package] = depth
                 
-            if verbose:
-                print(f"Processing {clean_package} (depth {depth})...", file=sys.stderr)
-                
-            visited.add(clean_package)
-            processed_count += 1
-
-            deps = get_dependencies(
-                package, 
-                verbose=verbose, 
-                include_conditional=include_conditional,
-                include_dev=include_dev,
-                fetch_license=fetch_license
-            )
-
-            tree[clean_package] = deps
-            for d in deps:
-                clean_dep = parse_requirement(d)
-                
-                # Record parent relationship for missing packages
-                if clean_dep in missing_packages and package not in missing_packages[clean_dep]['parents']:
-                    missing_packages[clean_dep]['parents'].add(package)
+                if verbose:
+                    print(f"Processing {clean_package} (depth {depth})...", file=sys.stderr)
+                    
+                # An exact pin on the root (e.g. "requests==2.31.0")
+                # selects that release instead of the latest one
+                version = pinned_version(package) if package == root_package else None
+                level.append((package, clean_package, version))
+            
+            # Fetch the whole level at once; PyPI requests are I/O bound
+            entries = _fetch_metadata_batch(executor, prefetch, [entry + (depth,) for entry in level], speculative)
+            
+            # Expanding the level from the fetched documents needs no
+            # more I/O, so it stays sequential
+            next_frontier = []
+            for (package, clean_package, version), entry in zip(level, entries):
+                record_metadata(clean_package, entry, version, fetch_license=fetch_license,
+                                thorough_investigation=thorough_investigation, investigate=investigate)
+                deps = [] if entry is None else _dependencies_from_metadata(
+                    entry.data, clean_package, version, verbose, include_conditional, include_dev)
+                processed_count += 1
+                tree[clean_package] = deps
+                for child in deps:
+                    clean_dep = child[1]
                     
-                if clean_dep not in visited:
-                    queue.append((d, depth + 1))
+                    # The first spec seen for each package is the one kept
+                    if clean_dep not in enqueued:
+                        enqueued.add(clean_dep)
+                        next_frontier.append(child)
+            
+            frontier = next_frontier
+            depth += 1
+    except BaseException:
+        # On Ctrl-C or an error, drop the queued (mostly speculative) fetches
+        # instead of letting a plain shutdown run every one of them first
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    else:
+        executor.shutdown()
     finally:
         # Stop the spinner thread
-        if not verbose:
-            spinner_active = False
-            # Wait for the spinner to clean up
-            time.sleep(0.2)
+        if spinner_thread is not None:
+            spinner_stop.set()
+            # Wait for the spinner to clear its line
+            spinner_thread.join()
+    
+    # Record which packages require each missing one from the finished tree,
+    # as the expansion order says nothing about when a fetch failed
+    for parent, deps in tree.items():
+        for _, clean_dep in deps:
+            if clean_dep in missing_packages:
+                missing_packages[clean_dep].parents.add(parent)
                     
     if verbose:
         print(f"Completed! Processed {processed_count} unique packages.", file=sys.stderr)
@@ -515,233 +1243,257 @@ def build_dependency_tree(root_package, max_depth=float('inf'), verbose=False, i
         
     return dict(tree), package_depths
 
-def print_dependency_tree(tree, root_package, indent=0, visited=None, show_license=False, show_investigation=True):
-    """Recursive printing to show the hierarchy in a 'pretty' format."""
+# The report printers below collect their lines in a list and write them
+# with a single call, rather than paying for one print() per line. Passing
+# `out` appends to the caller's list instead, so several reports can be
+# written together.
+
+# Lines joined per write, which bounds the size of each joined string
+WRITE_CHUNK_LINES = 4096
+
+def _write_lines(lines, stream=None):
+    """Write buffered report lines to stream (default stdout), one call per chunk."""
+    stream = stream or sys.stdout
+    for start in range(0, len(lines), WRITE_CHUNK_LINES):
+        stream.write("\n".join(lines[start:start + WRITE_CHUNK_LINES]) + "\n")
+
+def print_dependency_tree(tree, root_package, indent=0, visited=None, show_license=False, show_investigation=True, out=None):
+    """Print the hierarchy in a 'pretty' format, depth first."""
     if visited is None:
         visited = set()
+    lines = [] if out is None else out
 
-    clean_package = parse_requirement(root_package)
-    prefix = "  " * indent
-    
-    # Build the output string with package name
-    output = f"{prefix}- {root_package}"
-    
-    # Add license information if available
-    if show_license and clean_package in license_info:
-        license_text = license_info[clean_package]["license"]
-        output += f" [{license_text}]"
-    
-    # Add investigation flags indicator if available
-    if show_investigation and clean_package in investigation_flags:
-        output += " (!)"  # Simple flag indicator
-    
-    print(output)
-    
-    # If package has investigation flags, print them at an increased indent
-    if show_investigation and clean_package in investigation_flags:
-        flag_prefix = "  " * (indent + 1)
-        for flag in investigation_flags[clean_package]:
-            print(f"{flag_prefix}! {flag}")
+    # Walk with an explicit stack rather than recursion, so deep trees don't
+    # pay a Python call per node or run into the recursion limit
+    stack = [(root_package, parse_requirement(root_package), indent)]
+    while stack:
+        package, clean_package, level = stack.pop()
+        
+        # A package can be pushed by several parents before it is printed;
+        # like the recursive version, only its first occurrence is shown
+        if clean_package in visited:
+            continue
+        visited.add(clean_package)
+        
+        prefix = "  " * level
+        
+        # Build the output string with package name
+        output = f"{prefix}- {package}"
         
-    visited.add(clean_package)
+        # Add license information if available
+        if show_license and clean_package in license_info:
+            license_text = license_info[clean_package].license
+            output += f" [{license_text}]"
+        
+        # Add investigation flags indicator if available
+        flags = investigation_flags.get(clean_package) if show_investigation else None
+        if flags:
+            output += " (!)"  # Simple flag indicator
+        
+        lines.append(output)
+        
+        # If package has investigation flags, print them at an increased indent
+        if flags:
+            flag_prefix = prefix + "  "
+            lines.extend(f"{flag_prefix}! {flag}" for flag in flags)
+        
+        # Push children in reverse so they are popped in their original order
+        for dep, clean_dep in reversed(tree.get(clean_package, [])):
+            if clean_dep not in visited:
+                stack.append((dep, clean_dep, level + 1))
+    
+    if out is None:
+        _write_lines(lines)
 
-    for dep in tree.get(clean_package, []):
-        clean_dep = parse_requirement(dep)
-        if clean_dep not in visited:
-            print_dependency_tree(tree, dep, indent + 1, visited, show_license, show_investigation)
+# Everything the dependency report and the JSON output derive from a tree:
+#   package_names - sorted names of every package in the tree, root included
+#   child_index   - name -> [first full spec seen, set of parents requiring it];
+#                   a set since one parent can list the same package several
+#                   times (e.g. with different environment markers)
+#   direct_deps   - names of the root's own dependencies
+#   depth_counts  - Counter of how many packages were first seen at each depth
+#   max_depth     - deepest level reached (0 for an empty tree)
+ReportAggregates = namedtuple(
+    "ReportAggregates", ["package_names", "child_index", "direct_deps", "depth_counts", "max_depth"])
 
-def print_missing_packages_report():
-    """Print a report of all missing packages."""
-    global missing_packages
+def _compute_report_aggregates(tree, package_depths, root_package):
+    """Compute the ReportAggregates of a tree in one pass over its edges and one over the depths."""
+    clean_root = parse_requirement(root_package)
+    names = set(tree)
+    child_index = {}
+    direct_deps = set()
+    for parent, deps in tree.items():
+        is_root = parent == clean_root
+        for dep, name in deps:
+            entry = child_index.get(name)
+            if entry is None:
+                entry = child_index[name] = [dep, set()]
+                names.add(name)
+            entry[1].add(parent)
+            if is_root:
+                direct_deps.add(name)
     
+    depth_counts = Counter(package_depths.values())
+    return ReportAggregates(
+        package_names=sorted(names),
+        child_index=child_index,
+        direct_deps=direct_deps,
+        depth_counts=depth_counts,
+        max_depth=max(depth_counts) if depth_counts else 0,
+    )
+
+def print_missing_packages_report(out=None):
+    """Print a report of all missing packages."""
     if not missing_packages:
         return
+    lines = [] if out is None else out
         
-    print("\nMISSING PACKAGES REPORT")
-    print("======================")
-    print(f"Total missing packages: {len(missing_packages)}")
+    lines.append("\nMISSING PACKAGES REPORT")
+    lines.append("======================")
+    lines.append(f"Total missing packages: {len(missing_packages)}")
     
     for pkg, info in sorted(missing_packages.items()):
-        print(f"\n- {pkg}")
-        print(f"  Error: {info['error']}")
-        print(f"  Required by: {', '.join(sorted(info['parents'])) if info['parents'] else 'Unknown'}")
+        lines.append(f"\n- {pkg}")
+        lines.append(f"  Error: {info.error}")
+        lines.append(f"  Required by: {', '.join(sorted(info.parents)) if info.parents else 'Unknown'}")
         
         # Try to give some advice about the package
-        if "404" in info['error']:
-            if "pypi.org" in info['error']:
-                print("  Reason: This package is not available on PyPI. It might be:")
-                print("          - A private/internal package")
-                print("          - A GitHub repository directly referenced in requirements")
-                print("          - A deprecated package that has been removed")
-                print("          - A typo in the dependency specification")
-
-def print_license_report():
+        if "404" in info.error:
+            if "pypi.org" in info.error:
+                lines.append("  Reason: This package is not available on PyPI. It might be:")
+                lines.append("          - A private/internal package")
+                lines.append("          - A GitHub repository directly referenced in requirements")
+                lines.append("          - A deprecated package that has been removed")
+                lines.append("          - A typo in the dependency specification")
+    
+    if out is None:
+        _write_lines(lines)
+
+def print_license_report(out=None):
     """Print a report of license information for all packages."""
-    global license_info
+    lines = [] if out is None else out
     
     if not license_info:
-        print("\nNo license information available. Run with --license to fetch license data.")
+        lines.append("\nNo license information available. Run with --license to fetch license data.")
+        if out is None:
+            _write_lines(lines)
         return
     
-    print("\nLICENSE REPORT")
-    print("==============")
-    print(f"Total packages with license info: {len(license_info)}")
+    lines.append("\nLICENSE REPORT")
+    lines.append("==============")
+    lines.append(f"Total packages with license info: {len(license_info)}")
     
     # Group packages by license type
     license_groups = defaultdict(list)
     for pkg_name, info in sorted(license_info.items()):
-        license_type = info["license"]
+        license_type = info.license
         license_groups[license_type].append((pkg_name, info))
     
     # Print license groups
-    print("\nLicense distribution:")
+    lines.append("\nLicense distribution:")
     for license_type, packages in sorted(license_groups.items()):
-        print(f"  {license_type}: {len(packages)} packages")
+        lines.append(f"  {license_type}: {len(packages)} packages")
     
     # Print detailed license information for each package
-    print("\nDetailed license information:")
+    lines.append("\nDetailed license information:")
     for pkg_name, info in sorted(license_info.items()):
-        print(f"\n- {pkg_name}")
-        print(f"  License: {info['license']}")
-        if info["license_url"]:
-            print(f"  License URL: {info['license_url']}")
-        if info["project_url"]:
-            print(f"  Project URL: {info['project_url']}")
-        if info["author"]:
-            author_info = info["author"]
-            if info["author_email"]:
-                author_info += f" ({info['author_email']})"
-            print(f"  Author: {author_info}")
-
-def print_dependency_report(tree, package_depths, root_package, show_license=False):
-    """Print a comprehensive report of all dependencies with their depths."""
+        lines.append(f"\n- {pkg_name}")
+        lines.append(f"  License: {info.license}")
+        if info.license_url:
+            lines.append(f"  License URL: {info.license_url}")
+        if info.project_url:
+            lines.append(f"  Project URL: {info.project_url}")
+        if info.author:
+            author_info = info.author
+            if info.author_email:
+                author_info += f" ({info.author_email})"
+            lines.append(f"  Author: {author_info}")
+    
+    if out is None:
+        _write_lines(lines)
+
+def print_investigation_report(packages=None, out=None):
+    """Print the packages flagged for further investigation, limited to packages if given."""
+    lines = [] if out is None else out
+    flagged = sorted(
+        (pkg, flags) for pkg, flags in investigation_flags.items()
+        if packages is None or pkg in packages
+    )
+    
+    lines.append("\nPACKAGES REQUIRING FURTHER INVESTIGATION")
+    lines.append("=======================================")
+    lines.append(f"Total packages flagged: {len(flagged)}")
+    
+    for pkg, flags in flagged:
+        lines.append(f"\n- {pkg}")
+        for flag in flags:
+            lines.append(f"  • {flag}")
+        lines.append(f"  Recommendation: Verify system requirements and build environment")
+    
+    if out is None:
+        _write_lines(lines)
+
+def print_dependency_report(tree, package_depths, root_package, show_license=False, out=None, aggregates=None):
+    """Print a comprehensive report of all dependencies with their depths.
+    aggregates is _compute_report_aggregates() of the tree, if the caller already has it.
+    """
     clean_root = parse_requirement(root_package)
+    lines = [] if out is None else out
+    
+    if aggregates is None:
+        aggregates = _compute_report_aggregates(tree, package_depths, root_package)
+    child_index = aggregates.child_index
     
     # Get all unique packages from the tree
-    all_packages = set()
-    for pkg, deps in tree.items():
-        all_packages.add(pkg)
-        for dep in deps:
-            all_packages.add(parse_requirement(dep))
+    all_packages = set(aggregates.package_names)
     
     # Make a copy of all packages including root for analysis
-    all_packages_with_root = all_packages.copy()
-    all_packages_with_root.add(clean_root)
+    all_packages_with_root = all_packages | {clean_root}
     
     # Remove the root package from dependency count
-    if clean_root in all_packages:
-        all_packages.remove(clean_root)
+    all_packages.discard(clean_root)
     
     # Count direct dependencies
-    direct_deps = set(parse_requirement(dep) for dep in tree.get(clean_root, []))
+    direct_deps = aggregates.direct_deps
     
     # Count dependencies by depth
-    depth_counts = Counter(package_depths.values())
+    depth_counts = aggregates.depth_counts
     
     # Count packages requiring investigation - be sure to include root package if it needs investigation
-    investigation_count = sum(1 for pkg in all_packages if pkg in investigation_flags)
-    # Add root package to count if it needs investigation
-    if clean_root in investigation_flags:
-        investigation_count += 1
-    
-    # Helper function to get wheel type info for packages
-    def get_wheel_info(package):
-        data = metadata_cache.get(package)
-        if not data:
-            return None
-            
-        wheel_info = {
-            "has_wheels": False,
-            "wheel_types": [],
-            "is_pure_python": True
-        }
-        
-        release_info = data.get("urls", []) or []
-        
-        for release in release_info:
-            filename = release.get("filename", "").lower()
-            
-            if filename.endswith(".whl"):
-                wheel_info["has_wheels"] = True
-                
-                try:
-                    # Parse wheel filename components
-                    wheel_parts = filename[:-4].split('-')
-                    if len(wheel_parts) >= 3:
-                        # Last three components are python tag, abi tag, platform tag
-                        python_tag = wheel_parts[-3]
-                        abi_tag = wheel_parts[-2]
-                        platform_tag = wheel_parts[-1]
-                        
-                        # Pure Python wheels
-                        if abi_tag == 'none' and platform_tag == 'any':
-                            if "pure-python" not in wheel_info["wheel_types"]:
-                                wheel_info["wheel_types"].append("pure-python")
-                        # ABI3 wheels
-                        elif 'abi3' in abi_tag:
-                            if "abi3" not in wheel_info["wheel_types"]:
-                                wheel_info["wheel_types"].append("abi3")
-                                wheel_info["is_pure_python"] = False
-                        # CPython specific ABI wheels
-                        elif python_tag.startswith('cp') and abi_tag.startswith('cp'):
-                            if "cpython-abi" not in wheel_info["wheel_types"]:
-                                wheel_info["wheel_types"].append("cpython-abi")
-                                wheel_info["is_pure_python"] = False
-                        # Other platform-specific wheels
-                        elif platform_tag != 'any':
-                            if "platform-specific" not in wheel_info["wheel_types"]:
-                                wheel_info["wheel_types"].append("platform-specific")
-                                wheel_info["is_pure_python"] = False
-                except:
-                    pass
-                    
-            # Check for C extension module markers in filenames
-            if any(ext in filename for ext in [".so", ".pyd", ".dll"]):
-                wheel_info["is_pure_python"] = False
-                if "contains-extension-modules" not in wheel_info["wheel_types"]:
-                    wheel_info["wheel_types"].append("contains-extension-modules")
-        
-        return wheel_info
-    
-    # Analyze wheel types
-    wheel_type_counts = {
-        "pure-python": 0,
-        "abi3": 0,
-        "cpython-abi": 0, 
-        "platform-specific": 0,
-        "contains-extension-modules": 0
-    }
+    investigation_count = len(all_packages_with_root & investigation_flags.keys())
+    
+    # Analyze wheel types, using the same keys as the JSON wheel summary
+    wheel_type_counts = dict.fromkeys(WHEEL_TYPES, 0)
     
     # Count wheel types for all packages including root
     for pkg in all_packages_with_root:
         wheel_info = get_wheel_info(pkg)
         if wheel_info:
             for wheel_type in wheel_info["wheel_types"]:
-                if wheel_type in wheel_type_counts:
-                    wheel_type_counts[wheel_type] += 1
+                wheel_type_counts[wheel_type] += 1
     
     # Print the report
-    print(f"\nDEPENDENCY REPORT FOR {root_package}")
-    print(f"================================{'=' * len(root_package)}")
-    print(f"Total unique dependencies: {len(all_packages)}")
-    print(f"Direct dependencies: {len(direct_deps)}")
-    print(f"Max dependency depth: {max(package_depths.values()) if package_depths else 0}")
-    print(f"Packages requiring investigation: {investigation_count}")
+    lines.append(f"\nDEPENDENCY REPORT FOR {root_package}")
+    lines.append(f"================================{'=' * len(root_package)}")
+    lines.append(f"Total unique dependencies: {len(all_packages)}")
+    lines.append(f"Direct dependencies: {len(direct_deps)}")
+    lines.append(f"Max dependency depth: {aggregates.max_depth}")
+    lines.append(f"Packages requiring investigation: {investigation_count}")
     
     # Print wheel type summary
-    print("\nWheel type distribution:")
+    lines.append("\nWheel type distribution:")
     for wheel_type, count in wheel_type_counts.items():
         if count > 0:
-            print(f"  {wheel_type}: {count} packages")
+            lines.append(f"  {wheel_type}: {count} packages")
     
-    print("\nDependencies by depth:")
+    lines.append("\nDependencies by depth:")
     for depth in sorted(depth_counts.keys()):
         if depth == 0:  # Skip root
             continue
-        print(f"  Depth {depth}: {depth_counts[depth]} packages")
+        lines.append(f"  Depth {depth}: {depth_counts[depth]} packages")
         
     # Print dependencies sorted by depth
-    print("\nAll dependencies (sorted by depth):")
+    lines.append("\nAll dependencies (sorted by depth):")
     sorted_deps = sorted(
         [(pkg, depth) for pkg, depth in package_depths.items() if pkg != clean_root],
         key=lambda x: (x[1], x[0])  # Sort by depth, then by name
@@ -751,24 +1503,16 @@ def print_dependency_report(tree, package_depths, root_package, show_license=Fal
     for pkg, depth in sorted_deps:
         if current_depth != depth:
             current_depth = depth
-            print(f"\n  --- Depth {depth} ---")
+            lines.append(f"\n  --- Depth {depth} ---")
         
-        # Find the full spec in the tree
-        full_spec = None
-        for parent, deps in tree.items():
-            for dep in deps:
-                if parse_requirement(dep) == pkg:
-                    full_spec = dep
-                    break
-            if full_spec:
-                break
+        full_spec = child_index[pkg][0] if pkg in child_index else pkg
         
         # Start with the package name and spec
-        output = f"  {full_spec or pkg}"
+        output = f"  {full_spec}"
         
         # Add license info if available
         if show_license and pkg in license_info:
-            license_text = license_info[pkg]["license"]
+            license_text = license_info[pkg].license
             output += f" [{license_text}]"
             
         # Add wheel type if available
@@ -781,167 +1525,97 @@ def print_dependency_report(tree, package_depths, root_package, show_license=Fal
         if pkg in investigation_flags:
             output += " (!)"
             
-        print(output)
+        lines.append(output)
         
         # If package has investigation flags, print them indented
         if pkg in investigation_flags:
             for flag in investigation_flags[pkg]:
-                print(f"    ! {flag}")
+                lines.append(f"    ! {flag}")
     
     # Print missing packages report if any
-    print_missing_packages_report()
+    print_missing_packages_report(out=lines)
     
     # Print license report if requested
     if show_license:
-        print_license_report()
+        print_license_report(out=lines)
         
-    # Print investigation flags report if any
+    # Print investigation flags report if any, skipping packages that
+    # aren't the root or in our dependency tree
     if investigation_flags:
-        print("\nPACKAGES REQUIRING FURTHER INVESTIGATION")
-        print("=======================================")
-        print(f"Total packages flagged: {investigation_count}")
-        
-        for pkg, flags in sorted(investigation_flags.items()):
-            # Skip packages that aren't the root or in our dependency tree
-            if pkg != clean_root and pkg not in all_packages:
-                continue
-                
-            print(f"\n- {pkg}")
-            for flag in flags:
-                print(f"  • {flag}")
-            print(f"  Recommendation: Verify system requirements and build environment")
+        print_investigation_report(all_packages_with_root, out=lines)
+    
+    if out is None:
+        _write_lines(lines)
 
-def create_json_output(tree, package_depths, root_package):
+def _build_dep_info(pkg, child_index, package_depths, wheel_type_counts):
+    """Return the JSON entry for one dependency, adding its wheel types to wheel_type_counts."""
+    full_spec, direct_parents = child_index.get(pkg, (pkg, ()))
+    
+    dep_info = {
+        "name": pkg,
+        "full_spec": full_spec,
+        "depth": package_depths.get(pkg, -1),
+        "direct_parents": sorted(direct_parents)
+    }
+    
+    # Get wheel information
+    wheel_info = get_wheel_info(pkg)
+    if wheel_info:
+        dep_info.update(wheel_info)
+        for wheel_type in wheel_info["wheel_types"]:
+            wheel_type_counts[wheel_type] += 1
+    
+    # Add license information if available
+    if pkg in license_info:
+        lic = license_info[pkg]
+        dep_info["license"] = lic.license
+        if lic.license_url:
+            dep_info["license_url"] = lic.license_url
+        if lic.project_url:
+            dep_info["project_url"] = lic.project_url
+        if lic.author:
+            dep_info["author"] = lic.author
+            if lic.author_email:
+                dep_info["author_email"] = lic.author_email
+    
+    # Add investigation flags if available
+    flags = investigation_flags.get(pkg)
+    dep_info["investigation_required"] = bool(flags)
+    if flags:
+        dep_info["investigation_flags"] = flags
+        dep_info["recommendation"] = "Verify system requirements and build environment"
+    
+    return dep_info
+
+def create_json_output(tree, package_depths, root_package, aggregates=None):
     """
     Create a structured JSON representation of the dependency information.
+    aggregates is _compute_report_aggregates() of the tree, if the caller already has it.
     """
     clean_root = parse_requirement(root_package)
     
-    # Get all packages from tree
-    all_packages = set()
-    for pkg, deps in tree.items():
-        all_packages.add(pkg)
-        for dep in deps:
-            all_packages.add(parse_requirement(dep))
-            
-    # Helper function to get wheel information for a package
-    def get_wheel_info(package):
-        data = metadata_cache.get(package)
-        if not data:
-            return {}
-            
-        wheel_info = {
-            "has_wheels": False,
-            "wheel_types": [],
-            "is_pure_python": True
-        }
-        
-        release_info = data.get("urls", []) or []
-        
-        for release in release_info:
-            filename = release.get("filename", "").lower()
-            
-            if filename.endswith(".whl"):
-                wheel_info["has_wheels"] = True
-                
-                try:
-                    # Parse wheel filename components
-                    wheel_parts = filename[:-4].split('-')
-                    if len(wheel_parts) >= 3:
-                        # Last three components are python tag, abi tag, platform tag
-                        python_tag = wheel_parts[-3]
-                        abi_tag = wheel_parts[-2]
-                        platform_tag = wheel_parts[-1]
-                        
-                        wheel_type = None
-                        # Pure Python wheels
-                        if abi_tag == 'none' and platform_tag == 'any':
-                            wheel_type = "pure-python"
-                        # ABI3 wheels
-                        elif 'abi3' in abi_tag:
-                            wheel_type = "abi3"
-                            wheel_info["is_pure_python"] = False
-                        # CPython specific ABI wheels
-                        elif python_tag.startswith('cp') and abi_tag.startswith('cp'):
-                            wheel_type = "cpython-abi"
-                            wheel_info["is_pure_python"] = False
-                        # Other platform-specific wheels
-                        elif platform_tag != 'any':
-                            wheel_type = "platform-specific"
-                            wheel_info["is_pure_python"] = False
-                            
-                        if wheel_type and wheel_type not in wheel_info["wheel_types"]:
-                            wheel_info["wheel_types"].append(wheel_type)
-                except:
-                    pass
-                    
-            # Check for C extension module markers in filenames
-            if any(ext in filename for ext in [".so", ".pyd", ".dll"]):
-                wheel_info["is_pure_python"] = False
-                if "contains-extension-modules" not in wheel_info["wheel_types"]:
-                    wheel_info["wheel_types"].append("contains-extension-modules")
-        
-        return wheel_info
+    if aggregates is None:
+        aggregates = _compute_report_aggregates(tree, package_depths, root_package)
+    child_index = aggregates.child_index
     
-    # Create a list of all dependencies with their details
-    dependencies = []
-    for pkg in sorted(all_packages):
-        if pkg == clean_root:
-            continue  # Skip the root package
-            
-        # Find the full spec in the tree
-        full_spec = None
-        direct_parents = []
-        
-        for parent, deps in tree.items():
-            for dep in deps:
-                dep_name = parse_requirement(dep)
-                if dep_name == pkg:
-                    if not full_spec:
-                        full_spec = dep
-                    direct_parents.append(parent)
-        
-        dep_info = {
-            "name": pkg,
-            "full_spec": full_spec or pkg,
-            "depth": package_depths.get(pkg, -1),
-            "direct_parents": direct_parents
-        }
-        
-        # Get wheel information
-        wheel_info = get_wheel_info(pkg)
-        if wheel_info:
-            dep_info.update(wheel_info)
-        
-        # Add license information if available
-        if pkg in license_info:
-            dep_info["license"] = license_info[pkg]["license"]
-            if license_info[pkg]["license_url"]:
-                dep_info["license_url"] = license_info[pkg]["license_url"]
-            if license_info[pkg]["project_url"]:
-                dep_info["project_url"] = license_info[pkg]["project_url"]
-            if license_info[pkg]["author"]:
-                dep_info["author"] = license_info[pkg]["author"]
-                if license_info[pkg]["author_email"]:
-                    dep_info["author_email"] = license_info[pkg]["author_email"]
-        
-        # Add investigation flags if available
-        if pkg in investigation_flags:
-            dep_info["investigation_required"] = True
-            dep_info["investigation_flags"] = investigation_flags[pkg]
-            dep_info["recommendation"] = "Verify system requirements and build environment"
-        else:
-            dep_info["investigation_required"] = False
-        
-        dependencies.append(dep_info)
+    # Wheel type summary, counted as the dependencies are built
+    wheel_type_counts = dict.fromkeys(WHEEL_TYPES, 0)
+    
+    # Create a list of all dependencies with their details, skipping the root package
+    dependencies = [
+        _build_dep_info(pkg, child_index, package_depths, wheel_type_counts)
+        for pkg in aggregates.package_names
+        if pkg != clean_root
+    ]
     
     # Convert missing packages to a serializable format
+    # (sorted, since parallel fetching makes insertion order nondeterministic)
     missing = []
-    for pkg, info in missing_packages.items():
+    for pkg, info in sorted(missing_packages.items()):
         missing.append({
             "name": pkg,
-            "error": info["error"],
-            "required_by": sorted(info["parents"])
+            "error": info.error,
+            "required_by": sorted(info.parents)
         })
     
     # Create the final JSON structure
@@ -949,7 +1623,7 @@ def create_json_output(tree, package_depths, root_package):
         "root_package": root_package,
         "summary": {
             "total_dependencies": len(dependencies),
-            "max_depth": max(package_depths.values()) if package_depths else 0,
+            "max_depth": aggregates.max_depth,
             "missing_packages": len(missing),
             "packages_requiring_investigation": len(investigation_flags)
         },
@@ -959,39 +1633,35 @@ def create_json_output(tree, package_depths, root_package):
     
     # Add license summary if available
     if license_info:
-        license_counts = {}
-        for pkg, info in license_info.items():
-            license_type = info["license"]
-            license_counts[license_type] = license_counts.get(license_type, 0) + 1
+        # Counted in package order, which fixes the order of the keys
+        license_counts = Counter(info.license for _, info in sorted(license_info.items()))
         
         json_data["license_summary"] = {
             "packages_with_license_info": len(license_info),
-            "license_distribution": license_counts
+            "license_distribution": dict(license_counts)
         }
     
-    # Add wheel type summary
-    wheel_type_counts = {
-        "pure-python": 0,
-        "abi3": 0,
-        "cpython-abi": 0,
-        "platform-specific": 0,
-        "contains-extension-modules": 0
-    }
-    
-    for dep in dependencies:
-        for wheel_type in dep.get("wheel_types", []):
-            if wheel_type in wheel_type_counts:
-                wheel_type_counts[wheel_type] += 1
-    
-    # Only include non-zero counts
+    # Add wheel type summary, only including non-zero counts
     json_data["wheel_summary"] = {k: v for k, v in wheel_type_counts.items() if v > 0}
     
     return json_data
 
-def main():
+def _positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+def _build_parser():
+    """Build the command line parser."""
     parser = argparse.ArgumentParser(description="Print dependency tree from PyPI.")
     parser.add_argument("package", help="Name of the root package.")
-    parser.add_argument("--max-depth", type=int, default=None, 
+    # argparse doesn't apply type to non-string defaults, so inf stays a float
+    parser.add_argument("--max-depth", type=int, default=float('inf'), 
                        help="Maximum depth of the dependency tree (default: unlimited)")
     parser.add_argument("--report", "-r", action="store_true",
                        help="Show a comprehensive dependency report")
@@ -1009,78 +1679,104 @@ def main():
                        help="Flag packages that may require further investigation (e.g., FFI, system dependencies)")
     parser.add_argument("--json", "-j", action="store_true",
                        help="Output results in JSON format")
+    parser.add_argument("--compact-json", action="store_true",
+                       help="With --json, omit indentation and whitespace for smaller machine-readable output")
     parser.add_argument("--output", "-o", type=str, 
                        help="Write output to a file instead of stdout")
-    args = parser.parse_args()
-    
-    # Use either max_depth or infinity
-    max_depth = args.max_depth if args.max_depth is not None else float('inf')
-    
-    # Always gather metadata fully for license and investigation
-    fetch_metadata = True
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Ignore and don't write the on-disk PyPI metadata cache")
+    parser.add_argument("--cache-dir", type=str,
+                       help="Directory of the on-disk PyPI metadata cache "
+                            "(default: $PYREQS_CACHE_DIR, else $XDG_CACHE_HOME/pyreqs)")
+    parser.add_argument("--rate-limit", type=float, default=20,
+                       help="Maximum PyPI requests per second, 0 for no limit (default: 20)")
+    parser.add_argument("--workers", "-w", type=_positive_int, default=16,
+                       help="Number of parallel PyPI requests (default: 16)")
+    return parser
+
+# Built once at import, so repeated main() calls (e.g. from tests) reuse it
+_PARSER = _build_parser()
+
+def main(argv=None):
+    args = _PARSER.parse_args(argv)
+    
+    # Both are set from this run's arguments every time, so that e.g.
+    # --no-cache doesn't carry over into later main() calls in the process
+    global disk_cache_dir, rate_limiter
+    disk_cache_dir = None if args.no_cache else args.cache_dir or default_cache_dir()
+    rate_limiter = TokenBucket(args.rate_limit) if args.rate_limit > 0 else None
+    if args.workers > HTTP_POOL_SIZE:
+        resize_http_pools(args.workers)
+    
+    # Only work out what this run displays; --json is always the full dump
+    show_licenses = args.license or args.json
+    show_investigation = args.investigation or args.report or args.json
 
     tree, package_depths = build_dependency_tree(
         args.package, 
-        max_depth, 
+        args.max_depth, 
         args.verbose,
         include_conditional=args.all_deps,
         include_dev=args.include_dev,
-        fetch_license=fetch_metadata  # Always fetch full metadata to support all features
+        fetch_license=show_licenses,
+        max_workers=args.workers,
+        # Collect every investigation reason whenever they will be displayed
+        thorough_investigation=show_investigation,
+        investigate=show_investigation
     )
     
+    # The report and the JSON output share one pass over the tree; the other
+    # modes never read it
+    aggregates = None
+    if args.json or args.report:
+        aggregates = _compute_report_aggregates(tree, package_depths, args.package)
+    
     # Handle JSON output
     if args.json:
-        json_data = create_json_output(tree, package_depths, args.package)
-        json_output = json.dumps(json_data, indent=2)
+        json_data = create_json_output(tree, package_depths, args.package, aggregates=aggregates)
         
         # Output to file if specified, otherwise to stdout
         if args.output:
-            with open(args.output, 'w') as f:
-                f.write(json_output)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                write_json(json_data, f, compact=args.compact_json)
             print(f"JSON output written to {args.output}", file=sys.stderr)
         else:
-            print(json_output)
+            write_json(json_data, sys.stdout, compact=args.compact_json)
+            sys.stdout.write("\n")
     else:
         # Standard text output
-        if args.output:
-            # Redirect stdout to file
-            original_stdout = sys.stdout
-            sys.stdout = open(args.output, 'w')
+        # Collect all text output and write it in one go
+        out = []
         
         # Always print the tree unless JSON was requested
         # Only show investigation details in tree if specifically requested
-        print_dependency_tree(tree, args.package, show_license=args.license, show_investigation=args.investigation)
+        print_dependency_tree(tree, args.package, show_license=args.license, show_investigation=args.investigation, out=out)
         
         # Optionally print the report
         if args.report:
-            print_dependency_report(tree, package_depths, args.package, show_license=args.license)
+            print_dependency_report(tree, package_depths, args.package, show_license=args.license, out=out,
+                                    aggregates=aggregates)
         elif args.missing:
-            print_missing_packages_report()
+            print_missing_packages_report(out=out)
         elif args.license and not args.report:
             # Print license report if --license is specified but not --report
             # (as --report already includes the license report)
-            print_license_report()
+            print_license_report(out=out)
         elif args.investigation and not args.report:
             # Print investigation report if --investigation is specified but not --report
             # (as --report already includes the investigation report)
             if investigation_flags:
-                print("\nPACKAGES REQUIRING FURTHER INVESTIGATION")
-                print("=======================================")
-                print(f"Total packages flagged: {len(investigation_flags)}")
-                
-                for pkg, flags in sorted(investigation_flags.items()):
-                    print(f"\n- {pkg}")
-                    for flag in flags:
-                        print(f"  • {flag}")
-                    print(f"  Recommendation: Verify system requirements and build environment")
+                print_investigation_report(out=out)
             else:
-                print("\nNo packages requiring further investigation were found.")
-            
-        # Reset stdout if it was redirected
-        if args.output and not args.json:
-            sys.stdout.close()
-            sys.stdout = original_stdout
+                out.append("\nNo packages requiring further investigation were found.")
+        
+        # Output to file if specified, otherwise to stdout
+        if args.output:
+            with open(args.output, 'w') as f:
+                _write_lines(out, f)
             print(f"Output written to {args.output}", file=sys.stderr)
+        else:
+            _write_lines(out)
 
 if __name__ == "__main__":
     main()